@@ -1,49 +1,75 @@
 """
 Expense Agent Module
 
-LangGraph-based agent for processing expense entries with LLM.
+Agent for processing expense entries with LLM (parse -> validate -> save).
 """
 
 import os
+import re
 import json
+import asyncio
+import logging
+from collections import OrderedDict
 from typing import TypedDict, Literal, Optional
-from langgraph.graph import StateGraph, END
 from pydantic import BaseModel, Field
 
 from llm import LLM
-from db_utils import insert_expense, get_session_state, save_session_state
+from db_utils import insert_expense, insert_expenses_bulk, get_session_state, save_session_state
 from utils import (
     parse_json_from_text,
     load_config,
     load_prompts,
     format_currency,
+    to_cents,
     normalize_category
 )
 
 
+logger = logging.getLogger(__name__)
+
+# Fast path for simple inputs like "add 30 for groceries" or "$12.50 dining"
+# (the amount must end at a boundary, so "1,200", "3/4" and "12.505" don't match)
+_FAST = re.compile(
+    r'^\s*(?:add\s+)?\$?(\d+(?:\.\d{1,2})?)(?![\d,./])\s*(?:dollars?\b\s*)?'
+    r'(?:(?:for|on)\s+)?(?:([a-z]+)\b\s*(.*?))?\s*$',
+    re.I
+)
+
+# Digits and spelled-out number words, plus plain words (checked against the
+# category set); semantic cache hits must agree on both
+_AMOUNT_TOKENS = re.compile(
+    r'\d+(?:\.\d+)?|\b(?:zero|one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve|'
+    r'thirteen|fourteen|fifteen|sixteen|seventeen|eighteen|nineteen|twenty|thirty|forty|'
+    r'fifty|sixty|seventy|eighty|ninety|hundred|thousand|half|quarter)\b'
+)
+_WORDS = re.compile(r'[a-z]+')
+
+# Fallback messages that don't depend on request state
+PARSE_ERROR_MESSAGE = "I couldn't understand that. Please try again with something like 'add 30 dollars for groceries'"
+SAVE_ERROR_MESSAGE = "Sorry, there was an error saving your expense. Please try again."
+
+
 class ExpenseData(BaseModel):
     """Parsed expense data with validation"""
     action: str = "add"
-    amount: Optional[float] = None
+    amount_cents: Optional[int] = None
     category: Optional[str] = None
     note: Optional[str] = None
 
 
 class AgentState(TypedDict):
-    """State passed through the LangGraph workflow"""
+    """State passed between workflow steps (per-request fields only)"""
     text: str
     parsed_data: Optional[ExpenseData]
     validation_status: Literal["pending", "valid", "invalid_category", "invalid_amount", "error"]
     clarification_needed: bool
     clarification_message: Optional[str]
     expense_id: Optional[int]
-    user_id: str
-    history: list
 
 
 class ExpenseAgent:
     """
-    LangGraph agent for processing expense entries
+    Agent for processing expense entries
     
     Workflow:
     1. Parse natural language with LLM
@@ -71,7 +97,9 @@ class ExpenseAgent:
         self.llm = LLM(
             provider=llm_config.get("provider", "claude"),
             model_id=llm_config.get("model_id"),
-            region=os.getenv("AWS_REGION", "us-east-1")
+            region=os.getenv("AWS_REGION", "us-east-1"),
+            temperature=llm_config.get("temperature", 0.0),
+            prompt_caching=llm_config.get("prompt_caching", False)
         )
         
         # Get valid categories from config
@@ -89,13 +117,63 @@ class ExpenseAgent:
                 "health", "other"
             ]
         
-        # Build workflow
-        self.workflow = self._build_workflow()
+        # Joined category list, reused by the parse prompt and clarifications
+        self._categories_str = ", ".join(self.valid_categories)
+        
+        # Precomputed lookups for category normalization
+        self._cat_set = frozenset(c.lower() for c in self.valid_categories)
+        self._cat_list = list(self._cat_set)
+        
+        # Number of history items kept per session
+        self.max_history = self.config.get("agent", {}).get("max_history", 10)
+        
+        # Static parse prompt prefix (cacheable when llm.prompt_caching is on)
+        self._parse_prefix = self.prompts["parse_expense_prefix"].format(
+            categories=self._categories_str
+        )
+        
+        # Clarification templates
+        self._clarify_amount_template = self.prompts.get(
+            "clarify_amount",
+            "What amount did you want to add?"
+        )
+        self._clarify_category_template = self.prompts.get(
+            "clarify_category",
+            "'{category}' isn't a valid category. Choose from: {categories}"
+        )
+        
+        # LRU of raw LLM responses keyed on normalized text (only safe when deterministic)
+        self._parse_cache = OrderedDict()
+        self._parse_cache_size = 1024
+        self._parse_cache_hits = 0
+        
+        # Fast-path regex parse counters
+        self._parse_calls = 0
+        self._fast_hits = 0
+        
+        # Optional semantic cache for near-duplicate phrasings (needs fastembed)
+        semantic_config = self.config.get("semantic_cache", {})
+        self._embedder = None
+        self._semantic_threshold = semantic_config.get("threshold", 0.92)
+        self._semantic_max_entries = semantic_config.get("max_entries", 512)
+        self._cache_vecs = None
+        self._cache_vals = []
+        if semantic_config.get("enabled", False) and self.llm.temperature == 0:
+            try:
+                from fastembed import TextEmbedding
+                self._embedder = TextEmbedding(semantic_config.get("model", "BAAI/bge-small-en-v1.5"))
+            except Exception as e:
+                logger.warning("Semantic cache disabled (%s)", e)
+        
     
-    def process_expense(self, text: str, user_id: str = "me") -> dict:
+    async def process_expense(self, text: str, user_id: str = "me") -> dict:
         """
         Main entry point for processing expense
         
+        The session read runs concurrently with parsing (LLM call) and is
+        awaited before the expense is saved, so a failed read aborts the
+        request before anything is written.
+        
         Args:
             text: Natural language expense text
             user_id: User identifier
@@ -103,92 +181,266 @@ class ExpenseAgent:
         Returns:
             Response dictionary with status and message
         """
-        # Load session state
-        session = get_session_state(user_id)
+        # Load session state in the background
+        session_task = asyncio.create_task(asyncio.to_thread(get_session_state, user_id, self.max_history))
         
         # Initial state
-        initial_state: AgentState = {
-            "text": text,
-            "parsed_data": None,
-            "validation_status": "pending",
-            "clarification_needed": False,
-            "clarification_message": None,
-            "expense_id": None,
-            "user_id": user_id,
-            "history": session.get("history", [])
-        }
+        initial_state = self._initial_state(text)
         
         # Run workflow
-        final_state = self.workflow.invoke(initial_state)
+        try:
+            final_state, session = await self._run_workflow(initial_state, session_task)
+        except Exception:
+            session_task.cancel()
+            raise
+        
+        # Merge session history
+        history = session["history"]
         
-        # Update history
-        final_state["history"].append({
+        entry = {
             "text": text,
             "parsed": final_state["parsed_data"].model_dump() if final_state["parsed_data"] else None,
             "status": final_state["validation_status"]
-        })
-        
-        # Keep only last 10 history items
-        if len(final_state["history"]) > 10:
-            final_state["history"] = final_state["history"][-10:]
+        }
         
-        # Save session state
-        save_session_state(user_id, {"history": final_state["history"]})
+        # A repeated failed entry adds nothing, so skip the append and the write.
+        # Saved expenses are always recorded, even if identical to the last one.
+        if final_state["validation_status"] == "valid" or not history or history[-1] != entry:
+            # Update history (deque evicts the oldest item past max_history)
+            history.append(entry)
+            
+            # Save session state
+            await asyncio.to_thread(save_session_state, user_id, {"history": list(history)})
         
         # Format response
         return self._format_response(final_state)
     
-    def _build_workflow(self) -> StateGraph:
-        """Build LangGraph workflow"""
-        workflow = StateGraph(AgentState)
-        
-        # Add nodes
-        workflow.add_node("parse", self._parse_expense)
-        workflow.add_node("validate", self._validate_expense)
-        workflow.add_node("save", self._save_expense)
-        
-        # Define flow
-        workflow.set_entry_point("parse")
-        workflow.add_edge("parse", "validate")
-        workflow.add_conditional_edges(
-            "validate",
-            self._route_after_validation,
-            {
-                "save": "save",
-                "clarify": END
-            }
-        )
-        workflow.add_edge("save", END)
+    async def process_expense_batch(
+        self,
+        texts: list,
+        max_concurrency: int = 5
+    ) -> list:
+        """
+        Process many expense entries at once (e.g. bulk imports)
+        
+        Entries are parsed concurrently (bounded by a semaphore) and all
+        valid expenses are inserted with a single bulk statement. Session
+        history is not updated for batch entries.
+        
+        Args:
+            texts: Natural language expense texts
+            max_concurrency: Maximum concurrent LLM calls
+            
+        Returns:
+            List of response dictionaries, in the same order as texts
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def parse_one(text: str) -> AgentState:
+            state = self._initial_state(text)
+            async with semaphore:
+                state = await self._parse_expense(state)
+            return self._validate_expense(state)
         
-        return workflow.compile()
+        states = await asyncio.gather(*(parse_one(text) for text in texts))
+        
+        # Bulk insert all valid expenses
+        valid = [state for state in states if not state["clarification_needed"]]
+        if valid:
+            rows = [
+                (state["parsed_data"].amount_cents, state["parsed_data"].category, state["parsed_data"].note)
+                for state in valid
+            ]
+            try:
+                expense_ids = await asyncio.to_thread(insert_expenses_bulk, rows)
+                for state, expense_id in zip(valid, expense_ids):
+                    state["expense_id"] = expense_id
+            except Exception as e:
+                logger.error("Error saving expense batch: %s", e)
+                for state in valid:
+                    state["validation_status"] = "error"
+                    state["clarification_needed"] = True
+                    state["clarification_message"] = SAVE_ERROR_MESSAGE
+        
+        return [self._format_response(state) for state in states]
     
-    def _parse_expense(self, state: AgentState) -> AgentState:
-        """Node: Parse natural language with LLM"""
+    def _initial_state(self, text: str) -> AgentState:
+        """Build the initial workflow state for one entry"""
+        return {
+            "text": text,
+            "parsed_data": None,
+            "validation_status": "pending",
+            "clarification_needed": False,
+            "clarification_message": None,
+            "expense_id": None
+        }
+    
+    async def _run_workflow(self, state: AgentState, session_task: asyncio.Task) -> tuple:
+        """Run parse -> validate, then save or stop for clarification
         
-        # Build prompt
-        prompt = self.prompts["parse_expense"].format(
-            text=state["text"],
-            categories=", ".join(self.valid_categories)
-        )
+        The session read is awaited before the save step so a failed read
+        can't leave a committed expense behind a 500 response.
+        """
+        state = await self._parse_expense(state)
+        state = self._validate_expense(state)
+        session = await session_task
+        if not state["clarification_needed"]:
+            state = await self._save_expense(state)
+        return state, session
+    
+    async def _parse_expense(self, state: AgentState) -> AgentState:
+        """Step: Parse natural language with LLM (regex fast path for simple inputs)"""
+        
+        # Skip the LLM entirely when the regex can parse the input
+        self._parse_calls += 1
+        fast = self._try_regex_parse(state["text"])
+        if fast:
+            self._fast_hits += 1
+            logger.debug("Parse fast-path hit rate: %s/%s", self._fast_hits, self._parse_calls)
+            state["parsed_data"] = fast
+            return state
+        
+        # Normalize text so trivially different repeats share a cache entry
+        # (cache key only; the LLM sees the original text)
+        text_norm = " ".join(state["text"].lower().split())
         
-        # Call LLM
         try:
-            response = self.llm.invoke(prompt)
+            # Reuse the parse of a near-duplicate phrasing if one is cached
+            vec = None
+            if self._embedder:
+                vec = await asyncio.to_thread(self._embed, text_norm)
+                cached = self._semantic_lookup(vec, text_norm)
+                if cached:
+                    state["parsed_data"] = self._expense_from_json(cached)
+                    return state
+            
+            # Call LLM (through response cache when deterministic)
+            use_cache = self.llm.temperature == 0
+            cache_hit = use_cache and text_norm in self._parse_cache
+            if cache_hit:
+                self._parse_cache.move_to_end(text_norm)
+                response = self._parse_cache[text_norm]
+                self._parse_cache_hits += 1
+                logger.debug("Parse cache hits: %s", self._parse_cache_hits)
+            else:
+                response = await asyncio.to_thread(self._invoke_parse, state["text"])
+            
             parsed_json = parse_json_from_text(response)
             
             if parsed_json:
-                state["parsed_data"] = ExpenseData(**parsed_json)
+                # Skip pydantic validation; _validate_expense checks the fields
+                state["parsed_data"] = self._expense_from_json(parsed_json)
+                
+                # Only cache replies that parsed, so retries of a bad reply re-ask the LLM
+                if use_cache and not cache_hit:
+                    self._parse_cache[text_norm] = response
+                    if len(self._parse_cache) > self._parse_cache_size:
+                        self._parse_cache.popitem(last=False)
+                if vec is not None:
+                    self._semantic_store(vec, text_norm, parsed_json)
             else:
                 state["validation_status"] = "error"
                 
         except Exception as e:
-            print(f"Error parsing expense: {e}")
+            logger.error("Error parsing expense: %s", e)
             state["validation_status"] = "error"
         
         return state
     
+    def _embed(self, text: str):
+        """Embed text as a unit-length vector"""
+        import numpy as np
+        
+        vec = next(iter(self._embedder.embed([text])))
+        return vec / np.linalg.norm(vec)
+    
+    def _semantic_lookup(self, vec, text: str) -> Optional[dict]:
+        """Return the cached parse (without its note) of the most similar text, if close enough"""
+        if self._cache_vecs is None:
+            return None
+        
+        sims = self._cache_vecs @ vec
+        best = int(sims.argmax())
+        guard, parsed_json = self._cache_vals[best]
+        
+        # Similar phrasing with a different amount or category is not a hit;
+        # texts without an explicit category word never hit
+        amount_tokens, categories = self._semantic_guard(text)
+        if (
+            sims[best] > self._semantic_threshold
+            and categories
+            and guard == (amount_tokens, categories)
+        ):
+            logger.debug("Semantic cache hit (similarity %.3f)", sims[best])
+            # Only amount and category are guarded; the note belongs to the other phrasing
+            return {**parsed_json, "note": None}
+        return None
+    
+    def _semantic_guard(self, text: str) -> tuple:
+        """Amount tokens and exact category words that must agree for a semantic hit"""
+        categories = sorted({word for word in _WORDS.findall(text) if word in self._cat_set})
+        return (_AMOUNT_TOKENS.findall(text), categories)
+    
+    def _semantic_store(self, vec, text: str, parsed_json: dict):
+        """Add a parse to the semantic cache, evicting the oldest (FIFO) past the bound"""
+        import numpy as np
+        
+        if self._cache_vecs is None:
+            self._cache_vecs = vec[np.newaxis, :]
+        else:
+            self._cache_vecs = np.vstack([self._cache_vecs, vec])
+        self._cache_vals.append((self._semantic_guard(text), parsed_json))
+        
+        if len(self._cache_vals) > self._semantic_max_entries:
+            self._cache_vecs = self._cache_vecs[1:]
+            self._cache_vals.pop(0)
+    
+    def _try_regex_parse(self, text: str) -> Optional[ExpenseData]:
+        """
+        Parse structurally trivial input without the LLM, or return None
+        
+        Only taken for an exact category word (no fuzzy matching) or a bare
+        amount; anything ambiguous falls back to the LLM.
+        """
+        m = _FAST.match(text)
+        if not m:
+            return None
+        
+        category = None
+        note = None
+        if m.group(2):
+            category = m.group(2).lower()
+            note = m.group(3) or None
+            # Unknown word, or a note that may hold another amount
+            if category not in self._cat_set or (note and _AMOUNT_TOKENS.search(note.lower())):
+                return None
+            # Drop punctuation-only notes ("add 30 for groceries!")
+            if note and not re.search(r'\w', note):
+                note = None
+        
+        return ExpenseData.model_construct(
+            amount_cents=to_cents(m.group(1)),
+            category=category,
+            note=note
+        )
+    
+    @staticmethod
+    def _expense_from_json(parsed_json: dict) -> ExpenseData:
+        """Build ExpenseData from LLM JSON, converting the dollar amount to cents"""
+        return ExpenseData.model_construct(
+            action=parsed_json.get("action", "add"),
+            amount_cents=to_cents(parsed_json.get("amount")),
+            category=parsed_json.get("category"),
+            note=parsed_json.get("note")
+        )
+    
+    def _invoke_parse(self, text: str) -> str:
+        """Call the LLM to parse expense text, returning the raw response"""
+        suffix = self.prompts["parse_expense_suffix"].format(text=text)
+        return self.llm.invoke(self._parse_prefix, suffix)
+    
     def _validate_expense(self, state: AgentState) -> AgentState:
-        """Node: Validate parsed expense data"""
+        """Step: Validate parsed expense data"""
         
         parsed = state["parsed_data"]
         
@@ -196,22 +448,20 @@ class ExpenseAgent:
         if not parsed or state["validation_status"] == "error":
             state["validation_status"] = "error"
             state["clarification_needed"] = True
-            state["clarification_message"] = "I couldn't understand that. Please try again with something like 'add 30 dollars for groceries'"
+            state["clarification_message"] = PARSE_ERROR_MESSAGE
             return state
         
         # Validate amount
-        if not parsed.amount or parsed.amount <= 0:
+        if not parsed.amount_cents or parsed.amount_cents <= 0:
             state["validation_status"] = "invalid_amount"
             state["clarification_needed"] = True
-            state["clarification_message"] = self.prompts.get(
-                "clarify_amount",
-                "What amount did you want to add?"
-            ).format(text=state["text"])
+            state["clarification_message"] = self._clarify_amount_template.format(text=state["text"])
             return state
         
         # Validate and normalize category
         if parsed.category:
-            normalized = normalize_category(parsed.category, self.valid_categories)
+            parsed.category = str(parsed.category)
+            normalized = normalize_category(parsed.category, self._cat_set, self._cat_list)
             if normalized:
                 parsed.category = normalized
                 state["validation_status"] = "valid"
@@ -219,14 +469,11 @@ class ExpenseAgent:
             else:
                 state["validation_status"] = "invalid_category"
                 state["clarification_needed"] = True
-                state["clarification_message"] = self.prompts.get(
-                    "clarify_category",
-                    f"'{parsed.category}' isn't a valid category. Choose from: {', '.join(self.valid_categories)}"
-                ).format(
+                state["clarification_message"] = self._clarify_category_template.format(
                     text=state["text"],
-                    amount=parsed.amount,
+                    amount=format_currency(parsed.amount_cents),
                     category=parsed.category,
-                    categories=", ".join(self.valid_categories)
+                    categories=self._categories_str
                 )
         else:
             # No category provided, use "other"
@@ -236,32 +483,27 @@ class ExpenseAgent:
         
         return state
     
-    def _save_expense(self, state: AgentState) -> AgentState:
-        """Node: Save valid expense to database"""
+    async def _save_expense(self, state: AgentState) -> AgentState:
+        """Step: Save valid expense to database"""
         
         parsed = state["parsed_data"]
         
         try:
-            expense_id = insert_expense(
-                amount=parsed.amount,
+            expense_id = await asyncio.to_thread(
+                insert_expense,
+                amount_cents=parsed.amount_cents,
                 category=parsed.category,
                 note=parsed.note
             )
             state["expense_id"] = expense_id
         except Exception as e:
-            print(f"Error saving expense: {e}")
+            logger.error("Error saving expense: %s", e)
             state["validation_status"] = "error"
             state["clarification_needed"] = True
-            state["clarification_message"] = "Sorry, there was an error saving your expense. Please try again."
+            state["clarification_message"] = SAVE_ERROR_MESSAGE
         
         return state
     
-    def _route_after_validation(self, state: AgentState) -> Literal["save", "clarify"]:
-        """Decision: Route to save or clarification based on validation"""
-        if state["clarification_needed"]:
-            return "clarify"
-        return "save"
-    
     def _format_response(self, state: AgentState) -> dict:
         """Format final response for API"""
         
@@ -281,9 +523,9 @@ class ExpenseAgent:
         parsed = state["parsed_data"]
         return {
             "status": "success",
-            "message": f"{format_currency(parsed.amount)} added to {parsed.category}",
+            "message": f"{format_currency(parsed.amount_cents)} added to {parsed.category}",
             "expense_id": state["expense_id"],
-            "amount": parsed.amount,
+            "amount_cents": parsed.amount_cents,
             "category": parsed.category
         }
 
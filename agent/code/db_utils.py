@@ -6,8 +6,11 @@ Handles all PostgreSQL database operations with connection pooling.
 
 import psycopg2
 from psycopg2 import pool
-import json
+from psycopg2.extras import execute_values, register_default_jsonb
+import orjson
 import os
+import weakref
+from collections import deque
 from typing import Optional, Dict, List
 from datetime import datetime
 from contextlib import contextmanager
@@ -43,21 +46,53 @@ class DatabaseManager:
     Uses connection pooling for better performance in Lambda.
     """
     
-    _pool: Optional[pool.SimpleConnectionPool] = None
+    _pool: Optional[pool.ThreadedConnectionPool] = None
     _config: Optional[DatabaseConfig] = None
+    _prepared: "weakref.WeakSet" = weakref.WeakSet()
+    
+    # Server-side prepared statements, created once per pooled connection
+    PREPARED_STATEMENTS = (
+        """
+        PREPARE ins_expense(integer, text, text) AS
+        INSERT INTO expenses (amount_cents, category, note, date_added)
+        VALUES ($1, $2, $3, NOW())
+        RETURNING id
+        """,
+        """
+        PREPARE get_session(text) AS
+        SELECT state_json FROM sessions WHERE user_id = $1
+        """,
+        """
+        PREPARE upsert_session(text, jsonb) AS
+        INSERT INTO sessions (user_id, state_json, last_updated)
+        VALUES ($1, $2, NOW())
+        ON CONFLICT (user_id)
+        DO UPDATE SET
+            state_json = EXCLUDED.state_json,
+            last_updated = NOW()
+        WHERE sessions.state_json IS DISTINCT FROM EXCLUDED.state_json
+        """,
+    )
     
     @classmethod
     def initialize(cls, config: DatabaseConfig):
         """Initialize connection pool"""
         cls._config = config
-        cls._pool = pool.SimpleConnectionPool(
+        cls._pool = pool.ThreadedConnectionPool(
             config.min_conn,
             config.max_conn,
             host=config.host,
             port=config.port,
             database=config.database,
             user=config.user,
-            password=config.password
+            password=config.password,
+            # Detect dead sockets on warm containers that sat idle
+            keepalives=1,
+            keepalives_idle=30,
+            keepalives_interval=10,
+            keepalives_count=3,
+            connect_timeout=2,
+            application_name="budgetbuddy-lambda"
         )
     
     @classmethod
@@ -75,11 +110,39 @@ class DatabaseManager:
             cls.initialize(DatabaseConfig.from_env())
         
         conn = cls._pool.getconn()
+        
+        # Reused connections may have gone stale while the container was idle
+        if conn in cls._prepared and not cls._is_alive(conn):
+            cls._pool.putconn(conn, close=True)
+            conn = cls._pool.getconn()
+        
         try:
+            if conn not in cls._prepared:
+                cls._setup_connection(conn)
             yield conn
         finally:
             cls._pool.putconn(conn)
     
+    @staticmethod
+    def _is_alive(conn) -> bool:
+        """Cheap readiness probe for a pooled connection"""
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+    
+    @classmethod
+    def _setup_connection(cls, conn):
+        """Decode jsonb with orjson and prepare hot-path statements on a newly seen connection"""
+        register_default_jsonb(conn_or_curs=conn, loads=orjson.loads)
+        with conn.cursor() as cur:
+            for statement in cls.PREPARED_STATEMENTS:
+                cur.execute(statement)
+        conn.commit()
+        cls._prepared.add(conn)
+    
     @classmethod
     def close_all(cls):
         """Close all connections in pool"""
@@ -90,7 +153,7 @@ class DatabaseManager:
 class Expense(BaseModel):
     """Expense model"""
     id: Optional[int] = None
-    amount: float
+    amount_cents: int
     category: str
     note: Optional[str] = None
     date_added: Optional[datetime] = None
@@ -103,12 +166,12 @@ class SessionState(BaseModel):
     last_updated: Optional[datetime] = None
 
 
-def insert_expense(amount: float, category: str, note: Optional[str] = None) -> int:
+def insert_expense(amount_cents: int, category: str, note: Optional[str] = None) -> int:
     """
     Insert expense into database
     
     Args:
-        amount: Expense amount
+        amount_cents: Expense amount in cents
         category: Expense category
         note: Optional note
         
@@ -118,41 +181,62 @@ def insert_expense(amount: float, category: str, note: Optional[str] = None) ->
     with DatabaseManager.get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
+                "EXECUTE ins_expense(%s, %s, %s)",
+                (amount_cents, category, note)
+            )
+            expense_id = cur.fetchone()[0]
+            conn.commit()
+            return expense_id
+
+
+def insert_expenses_bulk(rows: List[tuple]) -> List[int]:
+    """
+    Insert many expenses with a single statement
+    
+    Args:
+        rows: List of (amount_cents, category, note) tuples
+        
+    Returns:
+        IDs of inserted expenses, in the same order as rows
+    """
+    with DatabaseManager.get_connection() as conn:
+        with conn.cursor() as cur:
+            results = execute_values(
+                cur,
                 """
-                INSERT INTO expenses (amount, category, note, date_added)
-                VALUES (%s, %s, %s, %s)
+                INSERT INTO expenses (amount_cents, category, note, date_added)
+                VALUES %s
                 RETURNING id
                 """,
-                (amount, category, note, datetime.now())
+                rows,
+                template="(%s, %s, %s, NOW())",
+                fetch=True
             )
-            expense_id = cur.fetchone()[0]
             conn.commit()
-            return expense_id
+            return [row[0] for row in results]
 
 
-def get_session_state(user_id: str) -> Dict:
+def get_session_state(user_id: str, max_history: int = 10) -> Dict:
     """
     Retrieve user session state
     
     Args:
         user_id: User identifier
+        max_history: Maximum number of history items to keep
         
     Returns:
-        Session state dictionary
+        Session state dictionary (history as a bounded deque)
     """
     with DatabaseManager.get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                "SELECT state_json FROM sessions WHERE user_id = %s",
-                (user_id,)
-            )
+            cur.execute("EXECUTE get_session(%s)", (user_id,))
             row = cur.fetchone()
             
-            if row:
-                return row[0] if isinstance(row[0], dict) else json.loads(row[0])
+            # state_json is jsonb, so psycopg2 returns it already decoded
+            state = row[0] if row else {"history": [], "context": {}}
             
-            # Return empty state if not found
-            return {"history": [], "context": {}}
+            state["history"] = deque(state.get("history", []), maxlen=max_history)
+            return state
 
 
 def save_session_state(user_id: str, state: Dict):
@@ -166,15 +250,8 @@ def save_session_state(user_id: str, state: Dict):
     with DatabaseManager.get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
-                """
-                INSERT INTO sessions (user_id, state_json, last_updated)
-                VALUES (%s, %s, %s)
-                ON CONFLICT (user_id) 
-                DO UPDATE SET 
-                    state_json = EXCLUDED.state_json,
-                    last_updated = EXCLUDED.last_updated
-                """,
-                (user_id, json.dumps(state), datetime.now())
+                "EXECUTE upsert_session(%s, %s)",
+                (user_id, orjson.dumps(state).decode())
             )
             conn.commit()
 
@@ -194,7 +271,7 @@ def get_recent_expenses(user_id: str, limit: int = 10) -> List[Expense]:
         with conn.cursor() as cur:
             cur.execute(
                 """
-                SELECT id, amount, category, note, date_added
+                SELECT id, amount_cents, category, note, date_added
                 FROM expenses
                 ORDER BY date_added DESC
                 LIMIT %s
@@ -206,7 +283,7 @@ def get_recent_expenses(user_id: str, limit: int = 10) -> List[Expense]:
             return [
                 Expense(
                     id=row[0],
-                    amount=float(row[1]),
+                    amount_cents=row[1],
                     category=row[2],
                     note=row[3],
                     date_added=row[4]
@@ -4,7 +4,9 @@ AWS Lambda Handler for BudgetBuddy Expense Agent
 Entry point for processing expense requests from the frontend.
 """
 
-import json
+import asyncio
+import logging
+import orjson
 import os
 import sys
 
@@ -12,10 +14,27 @@ import sys
 sys.path.append(os.path.dirname(__file__))
 
 from agent import ExpenseAgent
+from db_utils import DatabaseManager, DatabaseConfig
 
 
-# Initialize agent (reused across Lambda invocations)
-agent = None
+logger = logging.getLogger()
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
+
+CONFIG_PATH = "agent_config.yaml"
+PROMPTS_PATH = "prompts.yaml"
+
+
+# Initialize agent and connection pool during Lambda INIT (reused across invocations)
+try:
+    agent = ExpenseAgent(config_path=CONFIG_PATH, prompts_path=PROMPTS_PATH)
+except Exception as e:
+    logger.exception("Error initializing agent at import: %s", e)
+    agent = None
+
+try:
+    DatabaseManager.initialize(DatabaseConfig.from_env())
+except Exception as e:
+    logger.exception("Error initializing database pool at import: %s", e)
 
 
 def lambda_handler(event, context):
@@ -39,18 +58,20 @@ def lambda_handler(event, context):
     
     global agent
     
-    print(f"Received event: {json.dumps(event)}")
+    # Full event dump only at DEBUG (API Gateway events can be many KB)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Received event: %s", orjson.dumps(event).decode())
     
     try:
-        # Initialize agent on first invocation
+        # Retry initialization if it failed at import
         if agent is None:
             agent = ExpenseAgent(
-                config_path="agent_config.xml",
-                prompts_path="prompts.xml"
+                config_path=CONFIG_PATH,
+                prompts_path=PROMPTS_PATH
             )
         
         # Parse request body
-        body = json.loads(event.get("body", "{}"))
+        body = orjson.loads(event.get("body", "{}"))
         text = body.get("text", "").strip()
         user_id = body.get("user_id", "me")
         
@@ -61,24 +82,27 @@ def lambda_handler(event, context):
                 "message": "Please provide expense text"
             })
         
-        print(f"Processing expense for user '{user_id}': {text}")
-        
         # Process expense with agent
-        result = agent.process_expense(text, user_id)
+        result = asyncio.run(agent.process_expense(text, user_id))
+        
+        # One structured log record per request
+        logger.info(orjson.dumps({
+            "user_id": user_id,
+            "text_len": len(text),
+            "status": result["status"]
+        }).decode())
         
         return create_response(200, result)
         
-    except json.JSONDecodeError as e:
-        print(f"JSON decode error: {str(e)}")
+    except orjson.JSONDecodeError as e:
+        logger.warning("JSON decode error: %s", e)
         return create_response(400, {
             "error": "Invalid JSON in request body",
             "details": str(e)
         })
         
     except Exception as e:
-        print(f"Error processing request: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("handler_error")
         
         return create_response(500, {
             "error": "Internal server error",
@@ -105,19 +129,21 @@ def create_response(status_code: int, body: dict) -> dict:
             "Access-Control-Allow-Headers": "Content-Type",
             "Access-Control-Allow-Methods": "POST, OPTIONS"
         },
-        "body": json.dumps(body)
+        "body": orjson.dumps(body).decode()
     }
 
 
 # For local testing
 if __name__ == "__main__":
+    logging.basicConfig()
+    
     # Test event
     test_event = {
-        "body": json.dumps({
+        "body": orjson.dumps({
             "text": "add thirty dollars for groceries",
             "timestamp": "2025-10-22T00:00:00Z"
-        })
+        }).decode()
     }
     
     response = lambda_handler(test_event, None)
-    print(f"\nResponse: {json.dumps(json.loads(response['body']), indent=2)}")
+    print(f"\nResponse: {orjson.dumps(orjson.loads(response['body']), option=orjson.OPT_INDENT_2).decode()}")
@@ -5,12 +5,16 @@ Handles connection to AWS Bedrock and LLM invocation.
 """
 
 import boto3
-import json
+import logging
+from botocore.config import Config
 import os
 from enum import Enum
 from typing import Optional
 
 
+logger = logging.getLogger(__name__)
+
+
 class LLMProvider(str, Enum):
     """Supported LLM providers"""
     CLAUDE = "claude"
@@ -27,7 +31,9 @@ class LLM:
         self,
         provider: str = "claude",
         model_id: Optional[str] = None,
-        region: str = "us-east-1"
+        region: str = "us-east-1",
+        temperature: float = 0.0,
+        prompt_caching: bool = False
     ):
         """
         Initialize LLM client
@@ -36,15 +42,20 @@ class LLM:
             provider: LLM provider string (currently only "claude")
             model_id: Specific model ID (defaults to Claude 3.5 Sonnet)
             region: AWS region
+            temperature: Default sampling temperature (0 = deterministic)
+            prompt_caching: Mark the prompt prefix as a cache point (only for
+                models that support Bedrock prompt caching)
         """
         # Convert string to enum
         try:
             self.provider = LLMProvider(provider.lower())
         except ValueError:
-            print(f"Warning: Unsupported provider '{provider}'. Falling back to default provider 'claude'.")
+            logger.warning("Unsupported provider '%s'. Falling back to default provider 'claude'.", provider)
             self.provider = LLMProvider.CLAUDE
         
         self.region = region
+        self.temperature = temperature
+        self.prompt_caching = prompt_caching
         
         # Set model ID based on provider
         if model_id:
@@ -55,66 +66,87 @@ class LLM:
                 "anthropic.claude-3-5-sonnet-20241022-v2:0"
             )
         
-        # Initialize Bedrock client
-        self.client = boto3.client("bedrock-runtime", region_name=self.region)
+        # Initialize Bedrock client (kept alive across warm invocations)
+        self.client = boto3.client(
+            "bedrock-runtime",
+            region_name=self.region,
+            config=Config(
+                tcp_keepalive=True,
+                retries={"max_attempts": 2, "mode": "adaptive"},
+                connect_timeout=2,
+                read_timeout=15
+            )
+        )
     
     def invoke(
         self,
-        prompt: str,
+        cached_prefix: str,
+        dynamic_suffix: str,
         max_tokens: int = 1000,
-        temperature: float = 0.0,
+        temperature: Optional[float] = None,
         system_prompt: Optional[str] = None
     ) -> str:
         """
-        Invoke LLM with prompt
+        Invoke LLM with a cacheable prompt prefix and a per-request suffix
         
         Args:
-            prompt: User prompt/question
+            cached_prefix: Static part of the prompt (instructions), served from prompt cache
+            dynamic_suffix: Per-request part of the prompt (user input)
             max_tokens: Maximum tokens in response
-            temperature: Sampling temperature (0 = deterministic)
+            temperature: Sampling temperature (defaults to the client's temperature)
             system_prompt: Optional system prompt for context
             
         Returns:
             LLM response text
         """
+        if temperature is None:
+            temperature = self.temperature
+        
         if self.provider == LLMProvider.CLAUDE:
-            return self._invoke_claude(prompt, max_tokens, temperature, system_prompt)
+            return self._invoke_claude(cached_prefix, dynamic_suffix, max_tokens, temperature, system_prompt)
         else:
             raise ValueError(f"Unsupported provider: {self.provider}")
     
     def _invoke_claude(
         self,
-        prompt: str,
+        cached_prefix: str,
+        dynamic_suffix: str,
         max_tokens: int,
         temperature: float,
         system_prompt: Optional[str]
     ) -> str:
-        """Invoke Claude through Bedrock"""
+        """Invoke Claude through the Bedrock Converse API"""
+        
+        # Cache point marks the end of the cacheable prefix (if enabled)
+        content = [{"text": cached_prefix}]
+        if self.prompt_caching:
+            content.append({"cachePoint": {"type": "default"}})
+        content.append({"text": dynamic_suffix})
         
-        # Build request body
-        body = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": max_tokens,
-            "temperature": temperature,
+        # Build request
+        request = {
+            "modelId": self.model_id,
             "messages": [
                 {
                     "role": "user",
-                    "content": prompt
+                    "content": content
                 }
-            ]
+            ],
+            "inferenceConfig": {
+                "maxTokens": max_tokens,
+                "temperature": temperature
+            }
         }
         
         # Add system prompt if provided
         if system_prompt:
-            body["system"] = system_prompt
+            request["system"] = [{"text": system_prompt}]
         
         # Invoke model
-        response = self.client.invoke_model(
-            modelId=self.model_id,
-            body=json.dumps(body)
-        )
+        response = self.client.converse(**request)
         
-        # Parse response
-        response_body = json.loads(response["body"].read())
-        return response_body["content"][0]["text"]
-
+        # Log prompt cache usage
+        usage = response.get("usage", {})
+        logger.debug("LLM cacheReadInputTokens: %s", usage.get("cacheReadInputTokens", 0))
+        
+        return response["output"]["message"]["content"][0]["text"]
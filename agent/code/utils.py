@@ -5,10 +5,20 @@ Common utility functions for the agent.
 """
 
 import json
+import logging
+import orjson
 import re
+from rapidfuzz import process, fuzz
 from typing import Dict, Any, Optional
 
 
+logger = logging.getLogger(__name__)
+
+_JSON_CODE_BLOCK = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)
+_DECODER = json.JSONDecoder()
+_MIN_FUZZY_LENGTH = 4
+
+
 def parse_json_from_text(text: str) -> Optional[Dict[str, Any]]:
     """
     Extract and parse JSON from text that may contain other content
@@ -21,95 +31,128 @@ def parse_json_from_text(text: str) -> Optional[Dict[str, Any]]:
     """
     # Try parsing the whole text first
     try:
-        return json.loads(text.strip())
-    except json.JSONDecodeError:
+        return orjson.loads(text.strip())
+    except orjson.JSONDecodeError:
         pass
     
-    # Try finding JSON in text with regex
-    json_pattern = r'\{[^{}]*\}'
-    matches = re.findall(json_pattern, text)
-    
-    for match in matches:
+    # Try finding JSON in code blocks
+    for match in _JSON_CODE_BLOCK.findall(text):
         try:
-            return json.loads(match)
-        except json.JSONDecodeError:
+            return orjson.loads(match)
+        except orjson.JSONDecodeError:
             continue
     
-    # Try finding JSON in code blocks
-    code_block_pattern = r'```(?:json)?\s*(\{.*?\})\s*```'
-    matches = re.findall(code_block_pattern, text, re.DOTALL)
-    
-    for match in matches:
+    # Scan for the first decodable JSON object (handles nesting)
+    for i, ch in enumerate(text):
+        if ch != '{':
+            continue
         try:
-            return json.loads(match)
-        except json.JSONDecodeError:
+            obj, _ = _DECODER.raw_decode(text, i)
+            return obj
+        except ValueError:
             continue
     
     return None
 
 
+def _yaml_loader():
+    """Return the libyaml C loader when available, else the pure-Python one"""
+    import yaml
+    
+    return getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
 def load_config(config_path: str) -> Dict[str, Any]:
     """
-    Load configuration from YAML file
+    Load configuration, preferring the build-time baked module
     
     Args:
-        config_path: Path to config file
+        config_path: Path to config file (used when no baked module exists)
         
     Returns:
         Configuration dictionary
     """
+    try:
+        from _config_baked import CONFIG
+        return CONFIG
+    except ImportError:
+        pass
+    
     import yaml
     
     with open(config_path, 'r') as file:
         try:
-            config = yaml.safe_load(file)
+            config = yaml.load(file, Loader=_yaml_loader())
             return config
         except yaml.YAMLError as exc:
-            print(f"Error parsing YAML config: {exc}")
+            logger.error("Error parsing YAML config: %s", exc)
             return {}
 
 
 def load_prompts(prompts_path: str) -> Dict[str, str]:
     """
-    Load prompts from YAML file
+    Load prompts, preferring the build-time baked module
     
     Args:
-        prompts_path: Path to prompts file
+        prompts_path: Path to prompts file (used when no baked module exists)
         
     Returns:
         Dictionary of prompt templates
     """
+    try:
+        from _config_baked import PROMPTS
+        return PROMPTS
+    except ImportError:
+        pass
+    
     import yaml
     
     with open(prompts_path, 'r') as file:
         try:
-            prompts = yaml.safe_load(file)
+            prompts = yaml.load(file, Loader=_yaml_loader())
             return prompts
         except yaml.YAMLError as exc:
-            print(f"Error parsing YAML prompts: {exc}")
+            logger.error("Error parsing YAML prompts: %s", exc)
             return {}
 
 
-def format_currency(amount: float) -> str:
+def format_currency(amount_cents: int) -> str:
     """
     Format amount as currency
     
     Args:
-        amount: Dollar amount
+        amount_cents: Amount in cents
         
     Returns:
         Formatted string (e.g., "$30.00")
     """
-    return f"${amount:.2f}"
+    return f"${amount_cents // 100}.{amount_cents % 100:02d}"
 
 
-def normalize_category(category: str, valid_categories: list) -> Optional[str]:
+def to_cents(amount: Any) -> Optional[int]:
+    """
+    Convert a dollar amount (number or numeric string) to integer cents
+    
+    Args:
+        amount: Dollar amount (e.g., 30, "12.50")
+        
+    Returns:
+        Amount in cents, or None if not numeric
+    """
+    try:
+        return int(round(float(amount) * 100))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def normalize_category(category: str, cat_set: frozenset, cat_list: list) -> Optional[str]:
     """
     Normalize category name and check if valid
     
     Args:
         category: Category to normalize
-        valid_categories: List of valid categories
+        cat_set: Precomputed set of lowercase valid categories
+        cat_list: Same categories as a list (choices for fuzzy matching)
         
     Returns:
         Normalized category or None if invalid
@@ -117,13 +160,18 @@ def normalize_category(category: str, valid_categories: list) -> Optional[str]:
     category = category.lower().strip()
     
     # Exact match
-    if category in valid_categories:
+    if category in cat_set:
         return category
     
-    # Fuzzy match (simple substring)
-    for valid_cat in valid_categories:
-        if category in valid_cat or valid_cat in category:
-            return valid_cat
+    # Singular forms of plural categories ("grocery" -> "groceries")
+    plural = category[:-1] + "ies" if category.endswith("y") else category + "s"
+    if plural in cat_set:
+        return plural
     
-    return None
-
+    # Short tokens ("a", "at", "the") only count as exact matches
+    if len(category) < _MIN_FUZZY_LENGTH:
+        return None
+    
+    # Fuzzy match (whole-string edit distance, no partial/substring scoring)
+    hit = process.extractOne(category, cat_list, scorer=fuzz.ratio, score_cutoff=80)
+    return hit[0] if hit else None
@@ -4,12 +4,27 @@
 -- Expenses table
 CREATE TABLE IF NOT EXISTS expenses (
     id SERIAL PRIMARY KEY,
-    amount NUMERIC(10, 2) NOT NULL CHECK (amount >= 0),
+    amount_cents INTEGER NOT NULL CHECK (amount_cents >= 0),
     category VARCHAR(50) NOT NULL,
     note TEXT,
     date_added TIMESTAMP NOT NULL DEFAULT NOW()
 );
 
+-- Migrate existing databases from NUMERIC dollars to integer cents
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'expenses' AND column_name = 'amount'
+    ) THEN
+        ALTER TABLE expenses ADD COLUMN amount_cents INTEGER;
+        UPDATE expenses SET amount_cents = ROUND(amount * 100);
+        ALTER TABLE expenses ALTER COLUMN amount_cents SET NOT NULL;
+        ALTER TABLE expenses ADD CHECK (amount_cents >= 0);
+        ALTER TABLE expenses DROP COLUMN amount;
+    END IF;
+END $$;
+
 -- Index for fast queries by category and date
 CREATE INDEX IF NOT EXISTS idx_expenses_category_date 
     ON expenses(category, date_added DESC);
@@ -18,10 +33,10 @@ CREATE INDEX IF NOT EXISTS idx_expenses_category_date
 CREATE INDEX IF NOT EXISTS idx_expenses_date_added 
     ON expenses(date_added DESC);
 
--- Sessions table for LangGraph state
+-- Sessions table for per-user agent state (conversation history)
 CREATE TABLE IF NOT EXISTS sessions (
     user_id VARCHAR(50) PRIMARY KEY,
-    state_json JSONB NOT NULL DEFAULT '{}',
+    state_json JSONB NOT NULL DEFAULT '{}'::jsonb,
     last_updated TIMESTAMP NOT NULL DEFAULT NOW()
 );
 